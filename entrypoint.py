@@ -1,15 +1,28 @@
 #!/usr/bin/env python3
 
-import json
+import logging
 import os
+import pathlib
+import re
+import shutil
 import subprocess
 import sys
+import threading
 
-from contextlib import redirect_stdout
-import git
-import requests
+from concurrent.futures import FIRST_COMPLETED, FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+from lxml import etree
 
-# Lists all the known components and the order in which they should be built
+# orjson parses large event payloads considerably faster, but isn't available everywhere
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# Lists all the known components and the order in which builds are started when several are ready
 COMPONENTS_BUILD_ORDER = [
     "jitsi-utils",
     "jitsi-metaconfig",
@@ -20,77 +33,314 @@ COMPONENTS_BUILD_ORDER = [
     "jicofo"
 ]
 
-def error(msg: str) -> None:
-    print(f"[error]: {msg}", flush=True)
+# Position of each component in COMPONENTS_BUILD_ORDER
+COMPONENTS_BUILD_ORDER_INDEX = {component: i for (i, component) in enumerate(COMPONENTS_BUILD_ORDER)}
+
+# Maps each known component to the components it depends on.  Components whose
+# dependencies have all been built can be built in parallel.
+COMPONENT_DEPENDENCIES = {
+    "jitsi-utils": set(),
+    "jitsi-metaconfig": set(),
+    "jicoco": {"jitsi-utils", "jitsi-metaconfig"},
+    "rtp": {"jitsi-utils"},
+    "jitsi-media-transform": {"rtp", "jicoco"},
+    "jitsi-videobridge": {"jitsi-media-transform", "jicoco"},
+    "jicofo": {"jicoco"}
+}
+
+# The events which carry a pull request payload (pull_request_target is used for PRs from forks which need secrets)
+HANDLED_EVENT_NAMES = ["pull_request", "pull_request_target"]
+
+# The pull request event actions which trigger a build
+HANDLED_PR_ACTIONS = ["synchronize", "opened", "edited"]
+
+# Matches a single dep line in a PR description (see parse_deps)
+DEP_LINE_RE = re.compile(r"^use\s+(\S+)\s+(\S+)\s+(\S+)\s*$")
+
+# Namespace prefixes used when querying maven POM files
+POM_NAMESPACES = {"m": "http://maven.apache.org/POM/4.0.0"}
+
+# The maven executable used for builds.  Runners that provide the maven daemon can set this to 'mvnd' so
+# that a warm JVM is reused across component builds instead of starting a new one for each.
+MAVEN_EXECUTABLE = os.environ.get("MAVEN_EXECUTABLE", "mvn")
+
+# Number of threads maven uses to download artifacts
+MAVEN_ARTIFACT_THREADS = 8
+
+# When set, a bare mirror of each checked out repo is kept in this directory (e.g. one restored by actions/cache)
+# and components are checked out from it as worktrees, so later runs only fetch what changed
+GIT_MIRROR_DIR = os.environ.get("GIT_MIRROR_DIR")
+
+# One lock per mirror directory, so concurrent checkouts from the same repo don't clone or fetch into the
+# same mirror at the same time
+MIRROR_LOCKS = defaultdict(threading.Lock)
+MIRROR_LOCKS_LOCK = threading.Lock()
+
+# Environment for git commands which access remotes.  A missing repo or branch makes git ask for credentials,
+# so prompting is disabled to make it fail right away instead of hanging.
+GIT_ENV = {**os.environ, "GIT_TERMINAL_PROMPT": "0", "GIT_ASKPASS": "/bin/true"}
+
+# Maximum number of components built concurrently, overridable through the BUILD_JOBS environment variable.
+# Each build already runs maven with one thread per core and they share the local maven repository, so
+# this is kept small.
+MAX_BUILD_WORKERS = 2
+
+# The maven processes of the builds which are running, so they can be stopped when another build fails
+MAVEN_PROCESSES = dict()
+MAVEN_PROCESSES_LOCK = threading.Lock()
+BUILDS_STOPPED = threading.Event()
+
+# Maximum number of repositories cloned concurrently, overridable like git's --jobs through the CLONE_JOBS
+# environment variable
+MAX_CLONE_WORKERS = 8
+
+LOG_FORMAT = "[%(levelname)s]: %(message)s"
 
-def info(msg: str) -> None:
-    print(f"[info]: {msg}", flush=True)
+logger = logging.getLogger("entrypoint")
 
-def fail(msg: str) -> None:
-    error(msg)
+def fail(msg: str, *args) -> None:
+    logger.error(msg, *args)
     sys.exit(1)
 
+# Provides a logger for the build of a single component, which writes only to the given stream (instead of
+# the console).  Each build has its own logger, so builds running at the same time don't mix their logs.
+@contextmanager
+def component_logger(component_dir: str, stream):
+    log = logger.getChild(os.path.basename(component_dir))
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log.addHandler(handler)
+    log.propagate = False
+    try:
+        yield log
+    finally:
+        log.removeHandler(handler)
+
+def run_git(*args) -> None:
+    subprocess.run(
+        [
+            "git", "-c", "protocol.version=2", "-c", "core.preloadindex=true", "-c", "checkout.workers=0",
+            *args
+        ],
+        env=GIT_ENV,
+        check=True
+    )
+
+# Returns the path a component is checked out to, refusing any name (e.g. '..' or '/') which would put it
+# anywhere other than directly inside checkout_dir
+def component_path(checkout_dir: str, component_name: str) -> str:
+    checkout_dir = os.path.abspath(checkout_dir)
+    path = os.path.abspath(os.path.join(checkout_dir, component_name))
+    if os.path.dirname(path) != checkout_dir:
+        fail("Refusing to use path %s for component '%s': it is not directly inside %s", path, component_name, checkout_dir)
+    return path
+
+# Reads a number of parallel jobs from the given environment variable, falling back to default when it isn't set
+def get_jobs_from_env(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        jobs = int(value)
+    except ValueError:
+        jobs = 0
+    if jobs < 1:
+        fail("%s must be a positive integer, got '%s'", name, value)
+    return jobs
+
+def check_components_recognized(component_names) -> None:
+    unrecognized = [component for component in component_names if component not in COMPONENT_DEPENDENCIES]
+    if unrecognized:
+        fail("Unrecognized components: %s", unrecognized)
+
+def remove_checkout(path: str) -> None:
+    if os.path.islink(path):
+        os.remove(path)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+
 def checkout_component(component_name, repo, branch_name, checkout_dir):
-    info(f"Checking out branch '{branch_name}' from repo '{repo}' for component '{component_name}'")
-    git.Repo.clone_from(f"https://github.com/{repo}.git", os.path.join(checkout_dir, component_name), branch=branch_name, depth=1)
+    logger.info("Checking out branch '%s' from repo '%s' for component '%s'", branch_name, repo, component_name)
+    url = f"https://github.com/{repo}.git"
+    component_dir = component_path(checkout_dir, component_name)
+    # A checkout left behind by a previous run in the same workspace would make the clone fail
+    remove_checkout(component_dir)
+    if not GIT_MIRROR_DIR:
+        run_git(
+            "clone", "--quiet", "--depth=1", "--no-tags",
+            "--branch", branch_name,
+            url, component_dir
+        )
+        return
+    mirror_dir = os.path.abspath(os.path.join(GIT_MIRROR_DIR, f"{repo}.git"))
+    with MIRROR_LOCKS_LOCK:
+        mirror_lock = MIRROR_LOCKS[mirror_dir]
+    with mirror_lock:
+        if os.path.isdir(mirror_dir):
+            run_git("-C", mirror_dir, "fetch", "--quiet", "--prune", "--no-tags", "origin", "+refs/heads/*:refs/heads/*")
+        else:
+            # The mirror keeps full history without blobs, so later fetches only transfer new commits and the
+            # blobs that worktrees actually check out
+            logger.info("Creating mirror of repo '%s' in %s", repo, mirror_dir)
+            run_git("clone", "--quiet", "--bare", "--filter=blob:none", "--no-tags", url, mirror_dir)
+    # --force replaces the registration of a worktree left behind at the same path by a previous run,
+    # which saves running 'git worktree prune' separately
+    run_git("-C", mirror_dir, "worktree", "add", "--quiet", "--force", "--detach", component_dir, f"refs/heads/{branch_name}")
 
+# Clones are network-bound, so they are run concurrently; the first failure aborts the checkout.  Components
+# which use the same repo and branch are only cloned once, and the others are linked to that checkout.
 def checkout_components(components):
-    for (component, (repo, branch)) in components.items():
-        checkout_component(component, repo, branch, ".")
-
-def update_maven_deps(overridden_versions, component_dir: str) -> None:
-    for (component_name, component_version) in overridden_versions.items():
-        info(f"Setting {component_name} version in {component_dir} to {component_version}")
-        cmd = [
-            "xmlstarlet", "ed", "--inplace",
-            "-u", f"/_:project/_:dependencies/_:dependency[_:artifactId='{component_name}']/_:version", "-v", f"{component_version}",
-            "-u", f"/_:project/_:dependencyManagement/_:dependencies/_:dependency[_:artifactId='{component_name}']/_:version", "-v", f"{component_version}",
-            os.path.join(component_dir, "pom.xml")
+    if not components:
+        return
+    components_by_source = dict()
+    for (component, source) in components.items():
+        components_by_source.setdefault(source, []).append(component)
+    with ThreadPoolExecutor(max_workers=min(MAX_CLONE_WORKERS, len(components_by_source))) as executor:
+        futures = [
+            executor.submit(checkout_component, component, repo, branch, ".")
+            for ((repo, branch), (component, *_)) in components_by_source.items()
         ]
-        info(f"Running command: {cmd}")
-        result = subprocess.run(cmd, stdout=sys.stdout)
-        info(f"Substitution command ran with result {result.returncode}")
-        info(f"Running git diff in {component_dir} to see changes")
-        info(subprocess.check_output(["git", "diff", "-w"], cwd=component_dir).decode(sys.stdout.encoding))
-
-def get_component_version(component_dir: str) -> str:
-    cmd = ["xmlstarlet", "sel", "-t", "-v", "/_:project/_:version", os.path.join(component_dir, "pom.xml")]
-    info(f"Getting component version, running command {cmd}")
-    version = subprocess.check_output(cmd).decode(sys.stdout.encoding)
-    info(f"Got version for component {component_dir}: {version}")
+        (done, not_done) = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in not_done:
+            future.cancel()
+        for future in done:
+            future.result()
+    for (component, *sharing_components) in components_by_source.values():
+        for sharing_component in sharing_components:
+            logger.info("Using the checkout of %s for component '%s'", component, sharing_component)
+            link_path = component_path(".", sharing_component)
+            remove_checkout(link_path)
+            os.symlink(os.path.basename(component_path(".", component)), link_path)
+
+# Only the text of the changed <version> elements is replaced in the POM file, so everything else in it
+# (formatting, comments, the XML declaration) is left exactly as it was
+def update_maven_deps(overridden_versions, component_dir: str, pom_path: str, log: logging.Logger) -> etree._ElementTree:
+    pom = etree.parse(pom_path)
+    pom_lines = pathlib.Path(pom_path).read_bytes().splitlines(keepends=True)
+    dependencies = pom.xpath(
+        "/m:project/m:dependencies/m:dependency | /m:project/m:dependencyManagement/m:dependencies/m:dependency",
+        namespaces=POM_NAMESPACES
+    )
+    for dependency in dependencies:
+        component_name = dependency.findtext("m:artifactId", namespaces=POM_NAMESPACES)
+        version = dependency.find("m:version", namespaces=POM_NAMESPACES)
+        if component_name in overridden_versions and version is not None:
+            log.info("Setting %s version in %s to %s", component_name, component_dir, overridden_versions[component_name])
+            old_text = f">{escape(version.text or '')}</".encode("utf-8")
+            new_text = f">{escape(overridden_versions[component_name])}</".encode("utf-8")
+            line_index = version.sourceline - 1
+            if old_text not in pom_lines[line_index]:
+                raise RuntimeError(f"Couldn't find the {component_name} version on line {version.sourceline} of {pom_path}")
+            pom_lines[line_index] = pom_lines[line_index].replace(old_text, new_text, 1)
+            version.text = overridden_versions[component_name]
+    pathlib.Path(pom_path).write_bytes(b"".join(pom_lines))
+    log.info("Running git diff on %s to see changes", pom_path)
+    log.info("%s", subprocess.check_output(["git", "--no-pager", "diff", "-w", "--", "pom.xml"], cwd=component_dir, encoding="utf-8"))
+    return pom
+
+def get_component_version(pom: etree._ElementTree, log: logging.Logger) -> str:
+    version = str(pom.xpath("/m:project/m:version/text()", namespaces=POM_NAMESPACES)[0])
+    log.info("Got version for component %s: %s", pom.docinfo.URL, version)
     return version
 
-def build_component(component_dir: str, overridden_versions) -> str:
+# Builds a component, raising an exception if the build fails or was stopped (see stop_builds)
+def build_component(component_dir: str, pom_path: str, overridden_versions) -> str:
     with open(f"logs/{component_dir}.log", "w") as f:
-        with redirect_stdout(f):
-            update_maven_deps(overridden_versions, component_dir)
-            cmd = ["mvn", "-f", os.path.join(component_dir, "pom.xml"), "install", "-D", "skipTests"]
-            info(f"Running command {cmd}")
-            result = subprocess.run(cmd, stdout=sys.stdout)
-            info(f"Build finished with return code {result.returncode}")
-            if result.returncode != 0:
-                fail(f"Error building {component_dir}")
-            return get_component_version(component_dir)
-
-# Build the components for this PR in the proper order (according to COMPONENTS_BUILD_ORDER)
+        with component_logger(component_dir, f) as log:
+            pom = update_maven_deps(overridden_versions, component_dir, pom_path, log)
+            cmd = [
+                MAVEN_EXECUTABLE, "-T", "1C", "--batch-mode",
+                "-D", f"maven.artifact.threads={MAVEN_ARTIFACT_THREADS}",
+                "-f", pom_path, "install", "-D", "skipTests"
+            ]
+            log.info("Running command %s", cmd)
+            with MAVEN_PROCESSES_LOCK:
+                if BUILDS_STOPPED.is_set():
+                    raise RuntimeError("build was stopped")
+                process = subprocess.Popen(cmd, stdout=f, stderr=subprocess.STDOUT)
+                MAVEN_PROCESSES[component_dir] = process
+            returncode = process.wait()
+            with MAVEN_PROCESSES_LOCK:
+                del MAVEN_PROCESSES[component_dir]
+            log.info("Build finished with return code %s", returncode)
+            if returncode != 0:
+                raise RuntimeError(f"maven exited with return code {returncode}")
+            return get_component_version(pom, log)
+
+# Stops all running builds and keeps any more from starting
+def stop_builds() -> None:
+    with MAVEN_PROCESSES_LOCK:
+        BUILDS_STOPPED.set()
+        for process in MAVEN_PROCESSES.values():
+            process.terminate()
+
+# Returns every component the given component depends on, directly or through other components
+def get_all_dependencies(component: str) -> set:
+    all_dependencies = set()
+    to_visit = list(COMPONENT_DEPENDENCIES[component])
+    while to_visit:
+        dependency = to_visit.pop()
+        if dependency not in all_dependencies:
+            all_dependencies.add(dependency)
+            to_visit.extend(COMPONENT_DEPENDENCIES[dependency])
+    return all_dependencies
+
+# Returns, for each of the given components, the ones among them which have to be built before it
+def get_build_dependencies(components) -> dict:
+    build_dependencies = {component: get_all_dependencies(component) & components.keys() for component in components}
+    # Components checked out from the same repo and branch share one checkout (see checkout_components), so
+    # they can't be built at the same time; each one waits for those before it in COMPONENTS_BUILD_ORDER
+    components_by_source = dict()
+    for component in sorted(components, key=COMPONENTS_BUILD_ORDER_INDEX.__getitem__):
+        sharing_components = components_by_source.setdefault(components[component], [])
+        build_dependencies[component].update(sharing_components)
+        sharing_components.append(component)
+    return build_dependencies
+
+# Build the components for this PR, starting each one as soon as all of the components it depends on
+# (according to COMPONENT_DEPENDENCIES) have been built
 def build_components(components):
-    os.mkdir("logs")
+    os.makedirs("logs", exist_ok=True)
+    check_components_recognized(components)
+    pending = get_build_dependencies(components)
     overridden_versions = dict()
-    try:
-        build_order = sorted(components.keys(), key = lambda component_name: COMPONENTS_BUILD_ORDER.index(component_name))
-    except ValueError as e:
-        fail(f"Unrecognized component: {e}")
-    for component in build_order:
-        info(f"Building {component}")
-        version = build_component(f"./{component}", overridden_versions)
-        overridden_versions[component] = version
+    with ThreadPoolExecutor(max_workers=MAX_BUILD_WORKERS) as executor:
+        running = dict()
+        while pending or running:
+            ready = [component for (component, deps) in pending.items() if deps.issubset(overridden_versions)]
+            for component in sorted(ready, key=COMPONENTS_BUILD_ORDER_INDEX.__getitem__):
+                del pending[component]
+                logger.info("Building %s", component)
+                component_dir = f"./{component}"
+                pom_path = os.path.join(component_dir, "pom.xml")
+                running[executor.submit(build_component, component_dir, pom_path, dict(overridden_versions))] = component
+            (done, _) = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                component = running.pop(future)
+                try:
+                    overridden_versions[component] = future.result()
+                except Exception as e:
+                    stop_builds()
+                    for other_future in running:
+                        other_future.cancel()
+                    fail("Error building %s (see logs/%s.log): %s", component, component, e)
+
+# Creates the session shared across all GitHub API requests, so connections to the API are kept alive
+# and reused.  requests is only imported here so runs which exit early don't pay for importing it.
+def create_session(headers: dict):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    session.headers.update(headers)
+    return session
 
 def load_pr(url: str) -> dict:
-    info("Retrieving PR information")
-    pr_resp = requests.get(
+    logger.info("Retrieving PR information")
+    pr_resp = SESSION.get(
         url,
         headers={
-            **GH_REQUEST_HEADERS,
             # TODO: needed?
             "Accept": "application/vnd.github.shadow-cat-preview+json, application/vnd.github.sailor-v-preview+json",
         }
@@ -99,22 +349,32 @@ def load_pr(url: str) -> dict:
     return pr_resp.json()
 
 def get_pr_comments(url: str) -> dict:
-    info("Retrieving PR comments")
-    comments_resp = requests.get(
-        url,
-        headers={
-            **GH_REQUEST_HEADERS,
-        }
-    )
+    logger.info("Retrieving PR comments")
+    comments_resp = SESSION.get(url)
     comments_resp.raise_for_status()
     return comments_resp.json()
 
-def retrieve_pr(event: dict) -> dict:
-    if event["action"] in [ "synchronize", "opened", "edited" ]:
-        return load_pr(event["pull_request"]["_links"]["self"]["href"])
-    else:
-        info("Unhandled event action type: {}".format(event["action"]))
-        sys.exit(1)
+def branch_exists(repo: str, branch_name: str) -> bool:
+    branch_resp = SESSION.get(f"{GITHUB_API_URL}/repos/{repo}/branches/{quote(branch_name, safe='/')}")
+    if branch_resp.status_code == 404:
+        return False
+    branch_resp.raise_for_status()
+    return True
+
+# Make sure every overridden repo and branch exists before any of them are cloned, so a typo in the PR
+# description fails the run right away instead of after other clones have been done
+def validate_components(components):
+    sources = list(set(components.values()))
+    if not sources:
+        return
+    with ThreadPoolExecutor(max_workers=min(MAX_CLONE_WORKERS, len(sources))) as executor:
+        missing = [
+            source
+            for (source, exists) in zip(sources, executor.map(lambda source: branch_exists(*source), sources))
+            if not exists
+        ]
+    if missing:
+        fail("Repos or branches not found: %s", ", ".join(f"{repo} {branch}" for (repo, branch) in missing))
 
 # The expected input string are the deps lines after the 'deps:' prefix.  Each dep
 # line must be formatted like so:
@@ -125,46 +385,97 @@ def retrieve_pr(event: dict) -> dict:
 #   branch is the branch name to be checked out from that repo
 def parse_deps(deps: str) -> dict:
     overridden_components = dict()
-    lines = [line.strip() for line in deps.split("\n") if line.strip()]
-    for line in lines:
-        try:
-            (_, component, repo, branch) = line.split(" ")
-            info(f"Will use branch {branch} from repo {repo} for component {component}")
-            overridden_components[component] = (repo, branch)
-        except ValueError as err:
-            info(f"invalid line: {err}")
+    for line in deps.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = DEP_LINE_RE.match(line)
+        if not match:
+            logger.info("invalid line: '%s'", line)
+            continue
+        (component, repo, branch) = match.groups()
+        logger.info("Will use branch %s from repo %s for component %s", branch, repo, component)
+        overridden_components[component] = (repo, branch)
     return overridden_components
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.DEBUG if os.environ.get("RUNNER_DEBUG") == "1" else logging.INFO,
+        format=LOG_FORMAT
+    )
+
+    # A comma separated list of the users allowed to trigger builds.  When it is empty, anyone can.
+    ALLOWED_ACTORS = frozenset(actor.strip() for actor in os.environ.get("ALLOWED_ACTORS", "").split(",") if actor.strip())
+    GITHUB_ACTOR = os.environ.get("GITHUB_ACTOR")
+    GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+    GITHUB_EVENT_NAME = os.environ.get("GITHUB_EVENT_NAME")
     GITHUB_EVENT_PATH = os.environ["GITHUB_EVENT_PATH"]
     GITHUB_TOKEN = os.environ["GITHUB_TOKEN"]
+    MAX_BUILD_WORKERS = get_jobs_from_env("BUILD_JOBS", MAX_BUILD_WORKERS)
+    MAX_CLONE_WORKERS = get_jobs_from_env("CLONE_JOBS", MAX_CLONE_WORKERS)
+
+    if ALLOWED_ACTORS and GITHUB_ACTOR not in ALLOWED_ACTORS:
+        logger.info("Ignoring event triggered by unauthorized user %s", GITHUB_ACTOR)
+        sys.exit(0)
+
+    # Only pull request events are handled, and the event name is available without loading the event payload.
+    # It isn't set when running locally, in which case the payload's contents decide.
+    if GITHUB_EVENT_NAME and GITHUB_EVENT_NAME not in HANDLED_EVENT_NAMES:
+        logger.info("Unhandled event type: %s", GITHUB_EVENT_NAME)
+        sys.exit(1)
+
+    event = json_loads(pathlib.Path(GITHUB_EVENT_PATH).read_bytes())
+
+    logger.debug("loaded event info: %s", event)
 
-    with open(GITHUB_EVENT_PATH) as event_info_file:
-        event = json.load(event_info_file)
+    try:
+        action = event["action"]
+        pull_request = event["pull_request"]
+        pr_url = pull_request["_links"]["self"]["href"]
+        repo = pull_request["head"]["repo"]["full_name"]
+        component_name = pull_request["head"]["repo"]["name"]
+        branch_name = pull_request["head"]["ref"]
+    except KeyError as e:
+        fail("Event is missing field %s", e)
 
-    info(f"loaded event info: {json.dumps(event)}")
+    if action not in HANDLED_PR_ACTIONS:
+        logger.info("Unhandled event action type: %s", action)
+        sys.exit(1)
 
     GH_REQUEST_HEADERS = {
         "Authorization": f"Bearer {GITHUB_TOKEN}",
         "Content-Type": "application/json"
     }
+    SESSION = create_session(GH_REQUEST_HEADERS)
 
-    pr = retrieve_pr(event)
-    pr_body = pr["body"]
-    info(f"Got pr body '{pr_body}'")
-    try:
-        deps = pr_body.split("deps:")[1]
-        info(f"Got deps string: '{deps}'")
-        components = parse_deps(deps)
-    except IndexError:
-        info("No deps specified")
-        components = dict()
+    # Component names are used as checkout paths, so they are checked before anything is checked out
+    check_components_recognized([component_name])
+
+    # The code in this PR is described by the event itself, so it is checked out while the PR
+    # description (which lists any overridden components) is retrieved
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pr_checkout = executor.submit(checkout_component, component_name, repo, branch_name, ".")
+
+        pr = load_pr(pr_url)
+        # The body is null for PRs without a description
+        pr_body = pr["body"] or ""
+        logger.debug("Got pr body '%s'", pr_body)
+        (_, deps_prefix, deps) = pr_body.partition("deps:")
+        if deps_prefix:
+            logger.debug("Got deps string: '%s'", deps)
+            components = parse_deps(deps)
+        else:
+            logger.info("No deps specified")
+            components = dict()
+
+        # The code in this PR takes precedence over any override of the same component
+        components.pop(component_name, None)
+        check_components_recognized(components)
+        validate_components(components)
+        checkout_components(components)
+        pr_checkout.result()
 
     # Add the code in this PR to the list of components to build
-    repo = pr["head"]["repo"]["full_name"]
-    component_name = pr["head"]["repo"]["name"]
-    branch_name = pr["head"]["ref"]
     components[component_name] = (repo, branch_name)
-
-    checkout_components(components)
     build_components(components)
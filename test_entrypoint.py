@@ -0,0 +1,106 @@
+import logging
+import os
+import subprocess
+import tempfile
+import unittest
+
+from entrypoint import get_build_dependencies, update_maven_deps
+
+POM = """<?xml version="1.0" encoding="UTF-8"?>
+<!--
+  Copyright @ 2018 - present 8x8, Inc.
+-->
+<project xmlns="http://maven.apache.org/POM/4.0.0"
+         xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+         xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xsd/maven-4.0.0.xsd">
+    <artifactId>jitsi-videobridge</artifactId>
+    <version>2.1-SNAPSHOT</version>
+    <dependencyManagement>
+        <dependencies>
+            <dependency>
+                <artifactId>jicoco</artifactId>
+                <version>1.1-20-g1234567</version>
+            </dependency>
+        </dependencies>
+    </dependencyManagement>
+    <dependencies>
+        <!-- Comments and  odd   spacing are kept -->
+        <dependency>
+            <artifactId>jitsi-utils</artifactId>
+            <version>1.0-40-gabcdef0</version>
+        </dependency>
+        <dependency>
+            <artifactId>rtp</artifactId>
+            <version>1.0-5-g7654321</version>
+        </dependency>
+    </dependencies>
+</project>
+"""
+
+
+class GetBuildDependenciesTest(unittest.TestCase):
+    def test_transitive_dependencies_are_kept(self):
+        components = {
+            "jitsi-utils": ("bbaldino/jitsi-utils", "fix"),
+            "jitsi-videobridge": ("bbaldino/jitsi-videobridge", "feature"),
+        }
+        self.assertEqual(
+            get_build_dependencies(components),
+            {"jitsi-utils": set(), "jitsi-videobridge": {"jitsi-utils"}}
+        )
+
+    def test_independent_components_have_no_dependencies(self):
+        components = {
+            "rtp": ("bbaldino/rtp", "fix"),
+            "jicoco": ("bbaldino/jicoco", "fix"),
+        }
+        self.assertEqual(get_build_dependencies(components), {"rtp": set(), "jicoco": set()})
+
+    def test_only_components_being_built_are_included(self):
+        components = {
+            "jitsi-metaconfig": ("bbaldino/jitsi-metaconfig", "fix"),
+            "jicofo": ("bbaldino/jicofo", "feature"),
+        }
+        self.assertEqual(
+            get_build_dependencies(components),
+            {"jitsi-metaconfig": set(), "jicofo": {"jitsi-metaconfig"}}
+        )
+
+    def test_components_sharing_a_checkout_are_built_one_after_another(self):
+        components = {
+            "jicofo": ("bbaldino/jitsi-monorepo", "feature"),
+            "rtp": ("bbaldino/jitsi-monorepo", "feature"),
+            "jitsi-utils": ("bbaldino/jitsi-utils", "fix"),
+        }
+        self.assertEqual(
+            get_build_dependencies(components),
+            {"jitsi-utils": set(), "rtp": {"jitsi-utils"}, "jicofo": {"jitsi-utils", "rtp"}}
+        )
+
+
+class UpdateMavenDepsTest(unittest.TestCase):
+    def test_only_overridden_versions_change(self):
+        with tempfile.TemporaryDirectory() as component_dir:
+            subprocess.run(["git", "init", "--quiet", component_dir], check=True)
+            pom_path = os.path.join(component_dir, "pom.xml")
+            with open(pom_path, "w") as f:
+                f.write(POM)
+
+            update_maven_deps(
+                {"jitsi-utils": "1.0-41-g1111111", "jicoco": "1.1-21-g2222222"},
+                component_dir,
+                pom_path,
+                logging.getLogger("test")
+            )
+
+            with open(pom_path) as f:
+                self.assertEqual(
+                    f.read(),
+                    POM
+                        .replace("<version>1.0-40-gabcdef0</version>", "<version>1.0-41-g1111111</version>")
+                        .replace("<version>1.1-20-g1234567</version>", "<version>1.1-21-g2222222</version>")
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()